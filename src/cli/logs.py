@@ -0,0 +1,185 @@
+"""
+Logs 維運 CLI
+
+    python -m src.cli.logs export --since 2024-01-01 --out logs.ndjson.gz
+    python -m src.cli.logs migrate
+    python -m src.cli.logs rollup --unit hour --lookback 48
+"""
+import sys
+import gzip
+import json
+import asyncio
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from src.db import mongo
+from src.services.log_rollup_service import ROLLUP_COLLECTIONS, run_rollup
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _open_output(path: str):
+    # "-" 代表輸出到 stdout (一樣是 gzip 壓縮)
+    if path == "-":
+        return gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb")
+    return gzip.open(path, "wb")
+
+
+async def export_logs(since: datetime, until: datetime, out: str, event: str = None, chunk_size: int = 1000) -> int:
+    """以 chunk_size 為單位串流輸出 NDJSON.gz，記憶體只保留一個 batch"""
+    query = {mongo.LOG_TIME_FIELD: {"$gte": since, "$lt": until}}
+    if event:
+        query[f"{mongo.LOG_META_FIELD}.event"] = event
+
+    cursor = mongo.db[mongo.LOGS_COLLECTION].find(query, {"_id": 0}).sort(mongo.LOG_TIME_FIELD, 1).batch_size(chunk_size)
+    total = 0
+    with _open_output(out) as fh:
+        buffer = []
+        async for doc in cursor:
+            buffer.append(json.dumps(doc, default=str, ensure_ascii=False))
+            if len(buffer) >= chunk_size:
+                fh.write(("\n".join(buffer) + "\n").encode("utf-8"))
+                total += len(buffer)
+                buffer = []
+        if buffer:
+            fh.write(("\n".join(buffer) + "\n").encode("utf-8"))
+            total += len(buffer)
+    return total
+
+
+async def _move_plain_logs_to_legacy(chunk_size: int):
+    """
+    logs 是一般 collection 而 logs_legacy 已存在 (例如上次 migrate 後被並行寫入重建)：
+    沿用原本的 _id 搬進 logs_legacy，重複的 _id 直接略過，可重跑
+    """
+    source = mongo.db[mongo.LOGS_COLLECTION]
+    legacy = mongo.db[mongo.LEGACY_LOGS_COLLECTION]
+    while True:
+        batch = await source.find().sort("_id", 1).limit(chunk_size).to_list(length=chunk_size)
+        if not batch:
+            break
+        try:
+            await legacy.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # 11000 = duplicate key，代表之前已經搬過
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        await source.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+    await source.drop()
+
+
+async def promote_logs_collection(chunk_size: int = 1000):
+    """把一般 collection 的 logs 換成 Time-series；舊資料留在 logs_legacy 待搬移"""
+    kind = await mongo.logs_collection_type(mongo.db)
+    if kind == "timeseries":
+        return
+    if kind == "collection":
+        if await mongo.logs_collection_type(mongo.db, mongo.LEGACY_LOGS_COLLECTION) is None:
+            await mongo.db[mongo.LOGS_COLLECTION].rename(mongo.LEGACY_LOGS_COLLECTION)
+            print(f"📦 {mongo.LOGS_COLLECTION} 已改名為 {mongo.LEGACY_LOGS_COLLECTION}")
+        else:
+            await _move_plain_logs_to_legacy(chunk_size)
+            print(f"📦 {mongo.LOGS_COLLECTION} 的資料已併入 {mongo.LEGACY_LOGS_COLLECTION}")
+    try:
+        await mongo.create_logs_timeseries(mongo.db)
+    except CollectionInvalid:
+        pass
+    if await mongo.logs_collection_type(mongo.db) != "timeseries":
+        # 改名與建立之間有 Pod 寫入，又產生了一般 collection
+        raise RuntimeError(f"{mongo.LOGS_COLLECTION} 被並行寫入重建為一般 collection，請重新執行 migrate")
+    await mongo.ensure_logs_collection(mongo.db)
+
+
+def to_timeseries_doc(doc: dict) -> dict:
+    """
+    轉成 Time-series 格式：舊格式 {timestamp, event, user_id, data}，
+    或是 migrate 前就已寫進一般 logs 的新格式 {timestamp, meta, data} (保留原本的 meta)
+    """
+    return {
+        "_id": doc["_id"],
+        mongo.LOG_TIME_FIELD: doc.get("timestamp") or doc["_id"].generation_time.replace(tzinfo=None),
+        mongo.LOG_META_FIELD: doc.get(mongo.LOG_META_FIELD) or {"event": doc.get("event"), "user_id": doc.get("user_id")},
+        "data": doc.get("data", {}),
+    }
+
+
+async def migrate_legacy_logs(chunk_size: int = 1000) -> int:
+    """
+    把 logs_legacy (舊格式) 分批搬進 Time-series logs。
+    沿用舊文件的 _id，寫入前先略過已搬過的 _id，再從 logs_legacy 刪除，
+    因此在 insert 與 delete 之間中斷也可以安全重跑。
+    """
+    legacy = mongo.db[mongo.LEGACY_LOGS_COLLECTION]
+    target = mongo.db[mongo.LOGS_COLLECTION]
+    total = 0
+    while True:
+        batch = await legacy.find().sort("_id", 1).limit(chunk_size).to_list(length=chunk_size)
+        if not batch:
+            break
+        docs = [to_timeseries_doc(doc) for doc in batch]
+
+        # Time-series collection 不保證 _id 唯一，需自行查出已存在的 _id (加上時間範圍讓查詢只掃相關 bucket)
+        ids = [doc["_id"] for doc in docs]
+        times = [doc[mongo.LOG_TIME_FIELD] for doc in docs]
+        cursor = target.find(
+            {"_id": {"$in": ids}, mongo.LOG_TIME_FIELD: {"$gte": min(times), "$lte": max(times)}},
+            {"_id": 1},
+        )
+        existing = {found["_id"] async for found in cursor}
+        new_docs = [doc for doc in docs if doc["_id"] not in existing]
+        if new_docs:
+            await target.insert_many(new_docs, ordered=False)
+        await legacy.delete_many({"_id": {"$in": ids}})
+        total += len(new_docs)
+        print(f"📦 已搬移 {total} 筆")
+    return total
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.cli.logs", description="Audiophile logs 維運工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="串流匯出原始事件為 NDJSON.gz")
+    p_export.add_argument("--since", type=_parse_time, default=None, help="ISO 時間 (UTC)，預設 24 小時前")
+    p_export.add_argument("--until", type=_parse_time, default=None, help="ISO 時間 (UTC)，預設現在")
+    p_export.add_argument("--event", default=None)
+    p_export.add_argument("--out", default="-", help="輸出檔案，預設 stdout")
+    p_export.add_argument("--chunk-size", type=int, default=1000)
+
+    p_migrate = sub.add_parser("migrate", help="把舊版 logs 轉成 Time-series collection (請在部署完成後執行)")
+    p_migrate.add_argument("--chunk-size", type=int, default=1000)
+
+    p_rollup = sub.add_parser("rollup", help="手動重算彙總")
+    p_rollup.add_argument("--unit", choices=list(ROLLUP_COLLECTIONS), default="hour")
+    p_rollup.add_argument("--lookback", type=int, default=2)
+
+    args = parser.parse_args(argv)
+
+    # 連線訊息改寫到 stderr，避免污染 stdout 的匯出資料
+    with contextlib.redirect_stdout(sys.stderr):
+        await mongo.connect_to_mongo()
+    if mongo.db is None:
+        sys.exit(1)
+    try:
+        if args.command == "export":
+            until = args.until or datetime.utcnow()
+            since = args.since or until - timedelta(days=1)
+            total = await export_logs(since, until, args.out, args.event, args.chunk_size)
+            print(f"✅ 匯出 {total} 筆", file=sys.stderr)
+        elif args.command == "migrate":
+            await promote_logs_collection(args.chunk_size)
+            total = await migrate_legacy_logs(args.chunk_size)
+            print(f"✅ 搬移完成，共 {total} 筆")
+        elif args.command == "rollup":
+            await run_rollup(args.unit, lookback=args.lookback)
+            print(f"✅ {ROLLUP_COLLECTIONS[args.unit]} 已更新")
+    finally:
+        with contextlib.redirect_stdout(sys.stderr):
+            await mongo.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+"""
+獨立的分析 Job worker (搭配 JOB_INPROCESS_WORKERS=false，讓 API Pod 只負責接請求)
+
+    python -m src.cli.worker --concurrency 8
+"""
+import asyncio
+import argparse
+from src.core.config import settings
+from src.db import mongo
+from src.services.job_service import run_workers
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.cli.worker", description="Audiophile 分析 Job worker")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    # worker 完成 Job 時會寫 Log，需要 MongoDB 連線
+    await mongo.connect_to_mongo()
+    print(f"👷 Worker 啟動，concurrency={args.concurrency}")
+    try:
+        await run_workers(args.concurrency)
+    finally:
+        await mongo.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -30,7 +30,29 @@ class Settings(BaseSettings):
     # Redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
-    
+
+    # Logs (MongoDB time-series collection)
+    LOG_TTL_DAYS: int = 90
+    LOG_ROLLUP_ENABLED: bool = True  # 也可只在特定 Pod 開啟；開啟時各 Pod 以 Redis lease 輪流執行
+    LOG_ROLLUP_INTERVAL_SECONDS: int = 900
+
+    # 非同步分析 Job (Redis queue)
+    JOB_INPROCESS_WORKERS: bool = True
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 120
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RESULT_TTL_SECONDS: int = 3600
+    JOB_POLL_MAX_WAIT_SECONDS: int = 30
+
+    # 相似耳機索引 (記憶體內向量)
+    SIMILARITY_DIM: int = 1024
+    SIMILARITY_MAX_ENTRIES: int = 5000
+    SIMILARITY_MIN_SCORE: float = 0.25  # 低於此分數多半只是 hash 碰撞，不算相似
+    SIMILARITY_REFRESH_SECONDS: int = 300
+
+    # 品牌 / 型號自動完成
+    AUTOCOMPLETE_REFRESH_SECONDS: int = 60
+    AUTOCOMPLETE_MAX_POPULAR: int = 5000
 
     # --- 4. 外部 API 設定 ---
     GEMINI_API_KEY: Optional[str] = None
@@ -38,6 +60,21 @@ class Settings(BaseSettings):
     SPOTIFY_CLIENT_SECRET: Optional[str] = None
     SPOTIFY_REDIRECT_URI: str = "http://127.0.0.1:8000/callback"
 
+    # Gemini micro-batching：短時間內的多個 cache miss 合併成一次呼叫
+    GEMINI_BATCH_ENABLED: bool = False
+    GEMINI_BATCH_WINDOW_MS: int = 200
+    GEMINI_BATCH_MAX_SIZE: int = 8
+
+    # Gemini 輸出長度限制 (response schema 的 maxLength / maxItems 與 token 上限)
+    GEMINI_COMPACT_PROMPT: bool = True
+    GEMINI_OUTPUT_TOKEN_HEADROOM: float = 1.5  # max_output_tokens 由各欄位上限推算後再乘上此倍數
+    GEMINI_THINKING_BUDGET: int = 0  # 會加進 max_output_tokens；-1 代表動態 thinking (不設輸出上限)
+    GEMINI_MAX_SPEC_CHARS: int = 40
+    GEMINI_MAX_FEATURES: int = 5
+    GEMINI_MAX_FEATURE_CHARS: int = 16
+    GEMINI_MAX_ANALYSIS_CHARS: int = 150
+    GEMINI_MAX_SUMMARY_CHARS: int = 80
+
     # --- 5. Pydantic 設定 (V2 新寫法) ---
     model_config = SettingsConfigDict(
         # 指定讀取的檔案名稱
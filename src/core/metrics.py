@@ -0,0 +1,22 @@
+from prometheus_client import Counter, Histogram
+
+# 與 Instrumentator 共用預設 registry，一樣由 /metrics 匯出
+
+GEMINI_TOKENS = Counter(
+    "gemini_tokens_total",
+    "Gemini token usage from response usage metadata",
+    ["kind", "mode"],  # kind: prompt / output / thoughts；mode: single / batch
+)
+
+GEMINI_CALLS = Counter(
+    "gemini_calls_total",
+    "Gemini generate_content calls by outcome",
+    ["mode", "outcome"],  # outcome: ok / parse_error / error
+)
+
+GEMINI_OUTPUT_TOKENS = Histogram(
+    "gemini_output_tokens",
+    "Output tokens per Gemini call",
+    ["mode"],
+    buckets=(64, 128, 256, 512, 768, 1024, 2048, 4096, 8192),
+)
@@ -18,6 +18,12 @@ MONGO_URL = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/
 client: AsyncIOMotorClient = None
 db = None
 
+# logs 改用 Time-series collection：timestamp 為時間欄位，meta 內放 event / user_id
+LOGS_COLLECTION = "logs"
+LEGACY_LOGS_COLLECTION = "logs_legacy"
+LOG_TIME_FIELD = "timestamp"
+LOG_META_FIELD = "meta"
+
 # --- 3. 連線函式 (main.py 要呼叫這個！) ---
 async def connect_to_mongo():
     global client, db
@@ -28,9 +34,61 @@ async def connect_to_mongo():
         # 測試連線是否成功
         await client.admin.command('ping')
         print("✅ MongoDB 連線成功！")
+        await ensure_logs_collection(db)
     except Exception as e:
         print(f"❌ MongoDB 連線失敗: {e}")
 
+# --- 建立 / 檢查 logs 的 Time-series collection ---
+def _ttl_seconds(ttl_days: int = None) -> int:
+    return int((ttl_days if ttl_days is not None else settings.LOG_TTL_DAYS) * 86400)
+
+async def logs_collection_type(database, name: str = LOGS_COLLECTION):
+    """回傳 None (不存在) / "timeseries" / "collection" (一般 collection)"""
+    infos = await database.list_collections(filter={"name": name}).to_list(length=1)
+    return infos[0].get("type", "collection") if infos else None
+
+async def create_logs_timeseries(database, ttl_days: int = None):
+    await database.create_collection(
+        LOGS_COLLECTION,
+        timeseries={"timeField": LOG_TIME_FIELD, "metaField": LOG_META_FIELD, "granularity": "seconds"},
+        expireAfterSeconds=_ttl_seconds(ttl_days),
+    )
+    print(f"✅ 已建立 Time-series collection: {LOGS_COLLECTION} (TTL {_ttl_seconds(ttl_days)}s)")
+
+async def ensure_logs_collection(database, ttl_days: int = None):
+    """
+    啟動時確保 logs 是 Time-series collection 並套用 TTL。
+    已存在的一般 collection 不在這裡改名 (滾動更新時舊 Pod 還在寫入)，
+    只回報狀態，轉換交給 `python -m src.cli.logs migrate`。
+    """
+    ttl_seconds = _ttl_seconds(ttl_days)
+    try:
+        kind = await logs_collection_type(database)
+        if kind is None:
+            try:
+                await create_logs_timeseries(database, ttl_days)
+            except Exception as e:
+                # 可能是其他 Pod 同時建立，或舊版 Pod 搶先寫入產生了一般 collection
+                print(f"⚠️ 建立 {LOGS_COLLECTION} 失敗: {e}")
+            kind = await logs_collection_type(database)
+
+        if kind != "timeseries":
+            print(f"⚠️ {LOGS_COLLECTION} 不是 Time-series collection，TTL 與彙總效能不會生效；"
+                  f"請在部署完成後執行 `python -m src.cli.logs migrate`")
+            return
+
+        infos = await database.list_collections(filter={"name": LOGS_COLLECTION}).to_list(length=1)
+        if infos[0].get("options", {}).get("expireAfterSeconds") != ttl_seconds:
+            # 設定值改變時同步更新 TTL
+            await database.command({"collMod": LOGS_COLLECTION, "expireAfterSeconds": ttl_seconds})
+
+        # 個人歷史紀錄查詢用 (meta.user_id + meta.event + timestamp)
+        await database[LOGS_COLLECTION].create_index(
+            [(f"{LOG_META_FIELD}.user_id", 1), (f"{LOG_META_FIELD}.event", 1), (LOG_TIME_FIELD, -1)]
+        )
+    except Exception as e:
+        print(f"❌ [Logs Setup Error] {e}")
+
 # --- 4. 斷線函式 (main.py 也要呼叫這個！) ---
 async def close_mongo_connection():
     global client
@@ -47,9 +105,8 @@ async def log_request(event_type: str, data: dict, user_id: str = None):
 
     try:
         log_entry = {
-            "event": event_type,
-            "timestamp": datetime.utcnow(),
-            "user_id": user_id,
+            LOG_TIME_FIELD: datetime.utcnow(),
+            LOG_META_FIELD: {"event": event_type, "user_id": user_id},
             "data": data
         }
         # 直接使用 db.logs，不需要在最上面先定義 logs_collection
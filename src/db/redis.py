@@ -1,6 +1,7 @@
 import os
 import json
 import redis
+import redis.asyncio
 import logging
 from dotenv import load_dotenv
 
@@ -16,13 +17,22 @@ REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 try:
     pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True, socket_timeout=5)
     client = redis.Redis(connection_pool=pool)
+    # Job queue 需要 blocking 指令 (BLMOVE)，使用 async client 避免卡住 event loop
+    async_client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=10)
 except Exception as e:
     logging.error(f"Redis Connection Pool Error: {e}")
 
 CACHE_EXPIRE_SECONDS = 3600
 
+# Hash：canonical key -> 原始大小寫的 [brand, model] (重建索引時顯示用)
+NAMES_KEY = "headphone:names"
+
+def canonical_key(brand: str, model: str) -> str:
+    """耳機的正規化識別字串，快取與 Job 去重共用"""
+    return f"{brand.strip().lower()}:{model.strip().lower()}"
+
 def get_cached_recommendation(brand: str, model: str):
-    key = f"rec:{brand.lower()}:{model.lower()}"
+    key = f"rec:{canonical_key(brand, model)}"
     try:
         data = client.get(key)
         if data:
@@ -33,9 +43,41 @@ def get_cached_recommendation(brand: str, model: str):
     return None
 
 def set_cached_recommendation(brand: str, model: str, data: dict):
-    key = f"rec:{brand.lower()}:{model.lower()}"
+    key = f"rec:{canonical_key(brand, model)}"
     try:
         # 使用 try 確保即使寫入快取失敗，主流程依然能完成
-        client.setex(key, CACHE_EXPIRE_SECONDS, json.dumps(data))
+        pipe = client.pipeline()
+        pipe.setex(key, CACHE_EXPIRE_SECONDS, json.dumps(data))
+        pipe.hset(NAMES_KEY, canonical_key(brand, model), json.dumps([brand.strip(), model.strip()]))
+        pipe.execute()
     except Exception as e:
-        logging.error(f"Failed to save cache for {key}: {e}")
\ No newline at end of file
+        logging.error(f"Failed to save cache for {key}: {e}")
+
+async def get_display_names(keys: list) -> dict:
+    """canonical key -> (brand, model)；舊快取沒有記錄顯示名稱的 key 不會出現在結果中"""
+    if not keys:
+        return {}
+    names = {}
+    for key, raw in zip(keys, await async_client.hmget(NAMES_KEY, keys)):
+        try:
+            brand, model = json.loads(raw) if raw else (None, None)
+        except (ValueError, TypeError):
+            continue
+        if brand and model:
+            names[key] = (brand, model)
+    return names
+
+async def prune_display_names(live_keys: set):
+    """移除快取已過期的顯示名稱，避免 NAMES_KEY 無限成長"""
+    stale = [key for key in await async_client.hkeys(NAMES_KEY) if key not in live_keys]
+    if not stale:
+        return 0
+    # 掃描之後才寫入的快取仍然存在，不能刪
+    async with async_client.pipeline(transaction=False) as pipe:
+        for key in stale:
+            pipe.exists(f"rec:{key}")
+        alive = await pipe.execute()
+    expired = [key for key, exists in zip(stale, alive) if not exists]
+    if expired:
+        await async_client.hdel(NAMES_KEY, *expired)
+    return len(expired)
\ No newline at end of file
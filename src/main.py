@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
@@ -11,6 +12,11 @@ from prometheus_fastapi_instrumentator import Instrumentator
 from src.db.postgres import engine, Base
 from src.db.mongo import connect_to_mongo, close_mongo_connection
 from src.routers import auth, recommendation, user
+from src.core.config import settings
+from src.services.log_rollup_service import rollup_scheduler
+from src.services.job_service import run_workers
+from src.services.similarity_service import similarity_refresher
+from src.services.autocomplete_service import autocomplete_refresher
 
 # 設定 Logging，方便在 K8s Log 中追蹤啟動狀況
 logging.basicConfig(level=logging.INFO)
@@ -41,10 +47,32 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ MongoDB connection failed: {e}")
 
+    # 3. 啟動 Log 彙總排程 (每小時 / 每日 rollup)
+    rollup_task = None
+    if settings.LOG_ROLLUP_ENABLED:
+        rollup_task = asyncio.create_task(rollup_scheduler())
+
+    # 4. 分析 Job worker pool (也可關閉後改用 `python -m src.cli.worker` 獨立部署)
+    worker_task = None
+    if settings.JOB_INPROCESS_WORKERS:
+        worker_task = asyncio.create_task(run_workers())
+
+    # 5. 相似耳機索引：啟動時從 Redis 快取建立，之後定期補上新結果
+    similarity_task = asyncio.create_task(similarity_refresher())
+
+    # 6. 自動完成前綴索引：同樣從 Redis rec:* 建立並定期更新
+    autocomplete_task = asyncio.create_task(autocomplete_refresher())
+
     yield  # --- 應用程式運行中 ---
 
     # 🔴 【Shutdown】關閉時執行
     logger.info("🛑 Shutting down Application...")
+    if rollup_task:
+        rollup_task.cancel()
+    if worker_task:
+        worker_task.cancel()
+    similarity_task.cancel()
+    autocomplete_task.cancel()
     await close_mongo_connection()
     logger.info("💤 MongoDB Connection Closed.")
 
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, Request
-from typing import Optional
-from src.schema.schemas import HeadphoneRequest, TrackRecommendation
-from src.services.ai_service import analyze_headphone
-from src.services.music_service import search_track
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional
+from src.schema.schemas import HeadphoneRequest, TrackRecommendation, JobStatus, SimilarHeadphone, HeadphoneSuggestion
+from src.services.recommendation_service import generate_recommendation
+from src.services.job_service import enqueue_job, get_job, set_job_provisional, wait_for_job, STATUS_DONE, STATUS_FAILED
+from src.services.similarity_service import similarity_index
+from src.services.autocomplete_service import autocomplete_index, record_search
 from src.db.redis import get_cached_recommendation, set_cached_recommendation
 from src.db.mongo import log_request
 from src.models.user import User
@@ -13,6 +16,14 @@ from sqlalchemy.orm import Session
 
 router = APIRouter()
 
+# 輔助：相似度查詢是 NumPy 矩陣運算，丟到 thread 執行避免卡住 event loop
+async def _similar(brand: str, model: str, k: int) -> List[SimilarHeadphone]:
+    hits = await asyncio.to_thread(similarity_index.query, brand, model, k)
+    return [
+        SimilarHeadphone(brand=b, model=m, score=score, recommendation=TrackRecommendation(**rec))
+        for b, m, score, rec in hits
+    ]
+
 # 輔助：嘗試取得使用者但不強制
 async def get_optional_user(request: Request, db: Session = Depends(get_db)):
     auth = request.headers.get('Authorization')
@@ -32,47 +43,74 @@ async def get_recommendation(request: HeadphoneRequest, user: Optional[User] = D
     user_id = str(user.id) if user else None
     
     if cached:
+        # 有快取的名稱才計入自動完成的熱門度
+        autocomplete_index.add(request.brand, request.model)
+        record_search(request.brand, request.model)
         await log_request("search_cache_hit", {"brand": request.brand, "model": request.model}, user_id)
         return TrackRecommendation(**cached)
 
-    # 2. AI Analysis
-    ai_data = await analyze_headphone(request.brand, request.model)
-    should_cache = True
-    
-    if not ai_data:
-        should_cache = False
-        ai_data = {"specs": {}, "sound_features": [], "song_query": "Hotel California - Eagles", "detailed_analysis": {}, "summary": "AI Busy"}
-
-    # 3. Spotify Search
-    track = await search_track(ai_data["song_query"])
-    if not track:
-        should_cache = False
-        track = {"name": ai_data["song_query"], "artists": [{"name": "Unknown"}], "album": {"images": [{"url": ""}]}, "external_urls": {"spotify": "#"}, "id": "unknown"}
-
-    # 4. Assembly
-    analysis = ai_data.get("detailed_analysis", {})
-    result = {
-        "form_factor": ai_data.get("specs", {}).get("form_factor", "N/A"),
-        "connection": ai_data.get("specs", {}).get("connection", "N/A"),
-        "release_year": ai_data.get("specs", {}).get("year", "N/A"),
-        "price_range": ai_data.get("specs", {}).get("price", "N/A"),
-        "driver_config": ai_data.get("specs", {}).get("driver", "N/A"),
-        "sound_features": ai_data.get("sound_features", []),
-        "analysis_bass": analysis.get("bass", "N/A"),
-        "analysis_mids": analysis.get("mids", "N/A"),
-        "analysis_highs": analysis.get("highs", "N/A"),
-        "listening_guide": analysis.get("guide", "N/A"),
-        "title": track["name"],
-        "artist": track["artists"][0]["name"],
-        "comment": ai_data.get("summary", ""),
-        "cover_url": track["album"]["images"][0]["url"] if track["album"]["images"] else "",
-        "spotify_url": track["external_urls"]["spotify"],
-        "track_id": track["id"],
-        "preview_url": track.get("preview_url")
-    }
+    # 2. Gemini + Spotify
+    result, should_cache = await generate_recommendation(request.brand, request.model)
 
     if should_cache:
         set_cached_recommendation(request.brand, request.model, result)
+        similarity_index.add(request.brand, request.model, result)
+        autocomplete_index.add(request.brand, request.model)
+        record_search(request.brand, request.model)
     
     await log_request("search_headphone", {"brand": request.brand, "model": request.model, "result": result["title"]}, user_id)
-    return TrackRecommendation(**result)
\ No newline at end of file
+    return TrackRecommendation(**result)
+
+# --- 非同步模式：先回 202 + job id，結果由 worker 產生後再輪詢 ---
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+async def create_recommendation_job(request: HeadphoneRequest, response: Response, user: Optional[User] = Depends(get_optional_user)):
+    user_id = str(user.id) if user else None
+
+    # 命中快取就直接回結果，不進佇列
+    cached = get_cached_recommendation(request.brand, request.model)
+    if cached:
+        # 有快取的名稱才計入自動完成的熱門度
+        autocomplete_index.add(request.brand, request.model)
+        record_search(request.brand, request.model)
+        await log_request("search_cache_hit", {"brand": request.brand, "model": request.model}, user_id)
+        response.status_code = 200
+        return JobStatus(status=STATUS_DONE, result=TrackRecommendation(**cached))
+
+    job_id = await enqueue_job(request.brand, request.model, user_id)
+    response.headers["Location"] = f"/recommend/jobs/{job_id}"
+
+    # 暫時答案每個 Job 只算一次並存進 Job，之後輪詢直接讀取
+    job = await get_job(job_id) or {}
+    provisional = job.get("provisional")
+    if provisional is None and job.get("status") != STATUS_DONE:
+        hits = await _similar(request.brand, request.model, 1)
+        if hits:
+            provisional = await set_job_provisional(job_id, hits[0].model_dump())
+    return JobStatus(job_id=job_id, status=job.get("status", "queued"), provisional=provisional)
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_recommendation_job(job_id: str, wait: float = Query(0, ge=0, description="Long-polling 等待秒數")):
+    job = await wait_for_job(job_id, wait)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return JobStatus(
+        job_id=job_id,
+        status=job["status"],
+        result=TrackRecommendation(**job["result"]) if job.get("result") else None,
+        error=job.get("error") if job["status"] == STATUS_FAILED else None,
+        provisional=job.get("provisional") if job["status"] != STATUS_DONE else None,
+    )
+
+@router.get("/similar", response_model=List[SimilarHeadphone])
+async def get_similar_headphones(brand: str, model: str, k: int = Query(5, ge=1, le=50)):
+    """從已快取的分析結果找出聲音特色最接近的耳機 (不呼叫 Gemini)"""
+    return await _similar(brand, model, k)
+
+@router.get("/autocomplete", response_model=List[HeadphoneSuggestion])
+async def autocomplete_headphones(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50)):
+    """輸入時的品牌 / 型號建議，只查記憶體內的前綴索引 (已快取的名稱)"""
+    return [
+        HeadphoneSuggestion(brand=brand, model=model, popularity=popularity)
+        for brand, model, popularity in autocomplete_index.search(q, limit)
+    ]
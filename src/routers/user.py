@@ -55,7 +55,7 @@ async def check_fav(track_id: str, user: User = Depends(get_current_user), db =
 @router.get("/history")
 async def get_history(user: User = Depends(get_current_user), db = Depends(get_database)):
     log_col = db["logs"]
-    cursor = log_col.find({"user_id": str(user.id), "event": "search_headphone"}).sort("timestamp", -1).limit(20)
+    cursor = log_col.find({"meta.user_id": str(user.id), "meta.event": "search_headphone"}).sort("timestamp", -1).limit(20)
     results = []
     async for doc in cursor:
         results.append({
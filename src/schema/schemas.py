@@ -32,6 +32,28 @@ class TrackRecommendation(BaseModel):
     track_id: str
     preview_url: Optional[str] = None
 
+# 自動完成建議 (GET /recommend/autocomplete)
+class HeadphoneSuggestion(BaseModel):
+    brand: str
+    model: str
+    popularity: float
+
+# 相似耳機 (GET /recommend/similar)
+class SimilarHeadphone(BaseModel):
+    brand: str
+    model: str
+    score: float
+    recommendation: TrackRecommendation
+
+# 非同步分析 Job 的狀態 (POST / GET /recommend/jobs)
+class JobStatus(BaseModel):
+    job_id: Optional[str] = None
+    status: str  # queued / running / done / failed
+    result: Optional[TrackRecommendation] = None
+    error: Optional[str] = None
+    # 分析尚未完成時，先給最相近的已快取耳機當暫時答案
+    provisional: Optional[SimilarHeadphone] = None
+
 # --- 使用者驗證相關 Schema ---
 
 # 註冊與登入用的 (接收帳密)
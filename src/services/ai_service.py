@@ -1,48 +1,269 @@
 import json
-import time
+import asyncio
 from google import genai
 from google.genai import types
 from src.core.config import settings
+from src.core.metrics import GEMINI_TOKENS, GEMINI_CALLS, GEMINI_OUTPUT_TOKENS
+from src.db.redis import canonical_key
 
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+# 單支 / 批次 prompt 共用的 JSON 結構 (GEMINI_COMPACT_PROMPT=false 時才放進 prompt)
+ANALYSIS_FORMAT = """{
+        "specs": { "form_factor": "...", "connection": "...", "year": "...", "price": "...", "driver": "..." },
+        "sound_features": ["特色1", "特色2"],
+        "detailed_analysis": {
+            "bass": "低頻描述...", "mids": "中頻描述...", "highs": "高頻描述...", "guide": "試聽指南..."
+        },
+        "song_query": "Song Name - Artist",
+        "summary": "一句話總評這支耳機的特點和不足"
+    }"""
 
-async def analyze_headphone(brand: str, model: str):
+# 推算 max_output_tokens 用：中文約 1 token / 字 (保守估計)，每個字串欄位另計 key、引號與逗號
+TOKENS_PER_CHAR = 1.0
+TOKENS_PER_FIELD = 8
+IDENTITY_MAX_CHARS = 100
+
+def _text(max_length: int, description: str = None):
+    return types.Schema(type=types.Type.STRING, max_length=max_length, description=description)
+
+def _object(properties: dict):
+    return types.Schema(
+        type=types.Type.OBJECT, properties=properties,
+        required=list(properties), property_ordering=list(properties),
+    )
+
+def build_analysis_schema(with_identity: bool = False):
+    """
+    Gemini response schema，欄位對應 TrackRecommendation 的來源
+    (specs -> 規格欄位、detailed_analysis -> analysis_*、summary -> comment)
+    每個字串都有 maxLength，避免輸出過長拖慢生成
+    """
+    properties = {
+        "specs": _object({
+            field: _text(settings.GEMINI_MAX_SPEC_CHARS)
+            for field in ("form_factor", "connection", "year", "price", "driver")
+        }),
+        "sound_features": types.Schema(
+            type=types.Type.ARRAY, items=_text(settings.GEMINI_MAX_FEATURE_CHARS),
+            min_items=1, max_items=settings.GEMINI_MAX_FEATURES,
+        ),
+        "detailed_analysis": _object({
+            field: _text(settings.GEMINI_MAX_ANALYSIS_CHARS) for field in ("bass", "mids", "highs", "guide")
+        }),
+        "song_query": _text(settings.GEMINI_MAX_SPEC_CHARS * 2, "Song Name - Artist"),
+        "summary": _text(settings.GEMINI_MAX_SUMMARY_CHARS, "一句話總評特點和不足"),
+    }
+    if with_identity:
+        # 批次模式需原樣帶回 brand / model 才能分送結果
+        properties = {"brand": _text(IDENTITY_MAX_CHARS), "model": _text(IDENTITY_MAX_CHARS), **properties}
+    return _object(properties)
+
+def output_token_cap(items: int = 1, with_identity: bool = False):
+    """
+    由 schema 的欄位長度上限推算 max_output_tokens，並保留 headroom，
+    確保填滿上限的回應也不會被截斷成無法解析的 JSON
+    2.5 系列的 thinking token 也算在 max_output_tokens 內，因此再加上 GEMINI_THINKING_BUDGET；
+    budget 為 -1 (動態 thinking) 時無法預估，回傳 None 不設上限
+    """
+    if settings.GEMINI_THINKING_BUDGET < 0:
+        return None
+    chars = (
+        5 * settings.GEMINI_MAX_SPEC_CHARS
+        + settings.GEMINI_MAX_FEATURES * settings.GEMINI_MAX_FEATURE_CHARS
+        + 4 * settings.GEMINI_MAX_ANALYSIS_CHARS
+        + settings.GEMINI_MAX_SPEC_CHARS * 2  # song_query
+        + settings.GEMINI_MAX_SUMMARY_CHARS
+    )
+    fields = 5 + settings.GEMINI_MAX_FEATURES + 4 + 2
+    if with_identity:
+        chars += 2 * IDENTITY_MAX_CHARS
+        fields += 2
+    per_item = chars * TOKENS_PER_CHAR + fields * TOKENS_PER_FIELD
+    return int(per_item * items * settings.GEMINI_OUTPUT_TOKEN_HEADROOM) + 1 + settings.GEMINI_THINKING_BUDGET
+
+def _record_usage(resp, mode: str):
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, count in (
+        ("prompt", usage.prompt_token_count),
+        ("output", usage.candidates_token_count),
+        ("thoughts", usage.thoughts_token_count),
+    ):
+        if count:
+            GEMINI_TOKENS.labels(kind=kind, mode=mode).inc(count)
+    if usage.candidates_token_count:
+        GEMINI_OUTPUT_TOKENS.labels(mode=mode).observe(usage.candidates_token_count)
+
+def _get_client():
     try:
         if not settings.GEMINI_API_KEY:
             print("警告: 未設定 GEMINI_API_KEY")
             return None
-            
-        client = genai.Client(api_key=settings.GEMINI_API_KEY)
+
+        return genai.Client(api_key=settings.GEMINI_API_KEY)
     except Exception as e:
         print(f"Gemini Client 初始化失敗: {e}")
         return None
-    
-    prompt = f"""
+
+async def _generate_json(client, prompt: str, schema: types.Schema, max_output_tokens: int, mode: str = "single", attempts: int = 3):
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+        max_output_tokens=max_output_tokens,
+        thinking_config=types.ThinkingConfig(thinking_budget=settings.GEMINI_THINKING_BUDGET)
+        if settings.GEMINI_THINKING_BUDGET >= 0 else None,
+    )
+    for attempt in range(attempts):
+        try:
+            # print(f"AI 分析中... (Attempt {attempt+1})")
+            # 使用 async client，避免阻塞 event loop (worker 與 API 共用同一個 loop)
+            resp = await client.aio.models.generate_content(
+                model="gemini-2.5-flash", contents=prompt, config=config
+            )
+            _record_usage(resp, mode)
+        except Exception as e:
+            GEMINI_CALLS.labels(mode=mode, outcome="error").inc()
+            print(f"Gemini Error: {e}")
+        else:
+            try:
+                data = json.loads(resp.text)
+                GEMINI_CALLS.labels(mode=mode, outcome="ok").inc()
+                return data
+            except (TypeError, ValueError) as e:
+                # 通常是輸出被 max_output_tokens 截斷
+                GEMINI_CALLS.labels(mode=mode, outcome="parse_error").inc()
+                print(f"Gemini JSON Error: {e}")
+        if attempt == attempts - 1:
+            return None
+        await asyncio.sleep(1)
+    return None
+
+async def _analyze_single(brand: str, model: str):
+    client = _get_client()
+    if client is None:
+        return None
+
+    if settings.GEMINI_COMPACT_PROMPT:
+        # 結構交給 response schema 約束，prompt 只留角色與語氣
+        prompt = f"耳機：{brand} {model}。以想推人入坑的耳機發燒友口吻，用繁體中文精簡分析其規格與聽感，並推薦一首最能展現其特色的歌。"
+    else:
+        prompt = f"""
     使用者正在查詢耳機：{brand} {model}。
     請扮演一位「想推別人入坑的耳機發燒友」，提供深度的聽感分析。
     請回傳 JSON (不要 Markdown):
-    {{
-        "specs": {{ "form_factor": "...", "connection": "...", "year": "...", "price": "...", "driver": "..." }},
-        "sound_features": ["特色1", "特色2"],
-        "detailed_analysis": {{
-            "bass": "低頻描述...", "mids": "中頻描述...", "highs": "高頻描述...", "guide": "試聽指南..."
-        }},
-        "song_query": "Song Name - Artist",
-        "summary": "一句話總評這支耳機的特點和不足"
-    }}
+    {ANALYSIS_FORMAT}
+    """
+    return await _generate_json(client, prompt, build_analysis_schema(), output_token_cap())
+
+async def _analyze_batch(items: list):
+    """一次分析多支耳機，回傳 {canonical key: 分析結果}；缺漏的項目由呼叫端個別補查"""
+    client = _get_client()
+    if client is None:
+        return {}
+
+    if settings.GEMINI_COMPACT_PROMPT:
+        headphones = "；".join(f"{brand} / {model}" for brand, model in items)
+        prompt = f"耳機 (brand / model)：{headphones}。以想推人入坑的耳機發燒友口吻，用繁體中文逐一精簡分析規格與聽感並各推薦一首歌，brand 與 model 原樣帶回。"
+    else:
+        headphones = "\n".join(f"    - brand: {brand} / model: {model}" for brand, model in items)
+        prompt = f"""
+    使用者正在查詢以下耳機：
+{headphones}
+    請扮演一位「想推別人入坑的耳機發燒友」，為每一支耳機提供深度的聽感分析。
+    請回傳 JSON 陣列 (不要 Markdown)，每支耳機一個物件，並原樣帶回 "brand" 與 "model"，其餘欄位格式如下:
+    {ANALYSIS_FORMAT}
+    """
+    schema = types.Schema(
+        type=types.Type.ARRAY, items=build_analysis_schema(with_identity=True), max_items=len(items),
+    )
+    # 批次只試一次：失敗就立刻交給逐項呼叫 (各自有重試)，避免延遲疊加
+    data = await _generate_json(
+        client, prompt, schema, output_token_cap(len(items), with_identity=True), mode="batch", attempts=1
+    )
+    if not isinstance(data, list):
+        return {}
+
+    results = {}
+    for item in data:
+        if isinstance(item, dict) and item.get("brand") and item.get("model"):
+            results[canonical_key(str(item.pop("brand")), str(item.pop("model")))] = item
+    return results
+
+
+class GeminiBatcher:
+    """
+    Micro-batching：在 window 時間內收集不同耳機的 cache miss，
+    合併成一次 generate_content，再把結果分送回各個等待中的呼叫端
     """
-    
-    for attempt in range(3):
+
+    def __init__(self, window_seconds: float, max_size: int):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._pending = {}   # canonical key -> (brand, model, future)
+        self._timer = None
+        # 保留執行中 task 的參照，避免被 GC 回收導致等待者永遠拿不到結果
+        self._tasks = set()
+
+    async def submit(self, brand: str, model: str):
+        key = canonical_key(brand, model)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = (brand, model, asyncio.get_running_loop().create_future())
+            self._pending[key] = entry
+            if len(self._pending) >= self.max_size:
+                self._spawn(self._take())
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._on_timer)
+        # shield：單一呼叫端被取消時，不影響同一個 key 的其他等待者
+        return await asyncio.shield(entry[2])
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        batch, self._pending, self._timer = self._pending, {}, None
+        return batch
+
+    def _spawn(self, batch: dict):
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_timer(self):
+        self._timer = None
+        batch = self._take()
+        if batch:
+            self._spawn(batch)
+
+    async def _run(self, batch: dict):
+        results = {}
         try:
-            # print(f"AI 分析中... (Attempt {attempt+1})")
-            resp = client.models.generate_content(
-                model="gemini-2.5-flash", contents=prompt,
-                config=types.GenerateContentConfig(response_mime_type="application/json")
-            )
-            return json.loads(resp.text)
+            if len(batch) > 1:
+                results = await _analyze_batch([(brand, model) for brand, model, _ in batch.values()])
         except Exception as e:
-            print(f"Gemini Error: {e}")
-            if attempt == 2: 
-                return None 
-            time.sleep(1)
-    return None
\ No newline at end of file
+            print(f"Gemini Batch Error: {e}")
+
+        # 批次回應中缺漏的耳機 (或只有一支時) 改用單次呼叫
+        missing = [key for key in batch if key not in results]
+        singles = await asyncio.gather(
+            *(_analyze_single(batch[key][0], batch[key][1]) for key in missing), return_exceptions=True
+        )
+        for key, data in zip(missing, singles):
+            results[key] = None if isinstance(data, BaseException) else data
+
+        for key, (_, _, future) in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+_batcher = None
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        _batcher = GeminiBatcher(settings.GEMINI_BATCH_WINDOW_MS / 1000, settings.GEMINI_BATCH_MAX_SIZE)
+    return _batcher
+
+async def analyze_headphone(brand: str, model: str):
+    if settings.GEMINI_BATCH_ENABLED:
+        return await _get_batcher().submit(brand, model)
+    return await _analyze_single(brand, model)
@@ -0,0 +1,167 @@
+import re
+import heapq
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from src.core.config import settings
+from src.db import redis as redis_db
+
+logger = logging.getLogger("uvicorn")
+
+# ZSET：canonical key -> 搜尋次數 (各 Pod 共用的熱門度)
+POPULARITY_KEY = "search:popularity"
+
+# 1~3 個字元的前綴命中範圍最大，重建時預先算好前 TOP_K 名 (新增或熱門度變動後，下次查詢時重算)
+SHORT_PREFIX_LEN = 3
+TOP_K = 50
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z\u4e00-\u9fff]+")
+
+
+def normalize(text: str) -> str:
+    """去掉空白與符號，讓 "HD 650"、"hd-650" 與 "hd650" 視為同一個前綴"""
+    return _NON_ALNUM_RE.sub("", (text or "").lower())
+
+
+class PrefixIndex:
+    """
+    已知耳機名稱的前綴索引 (排序陣列 + bisect)
+    每支耳機同時以「品牌+型號」與「型號」兩種字串建立索引，輸入型號開頭也能找到
+    """
+
+    def __init__(self):
+        self._terms = []        # 排序過的 (term, canonical key)
+        self._names = {}        # canonical key -> (brand, model)
+        self._popularity = {}   # canonical key -> 搜尋次數
+        self._top = {}          # 短前綴 -> 預先排序好的 canonical keys
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, key: str):
+        return key in self._names
+
+    @staticmethod
+    def _terms_for(brand: str, model: str):
+        return {term for term in (normalize(brand + model), normalize(model)) if term}
+
+    def _invalidate(self, brand: str, model: str):
+        # 預先排好的短前綴結果已不正確，下次查詢時重新排序
+        for term in self._terms_for(brand, model):
+            for n in range(1, SHORT_PREFIX_LEN + 1):
+                self._top.pop(term[:n], None)
+
+    def add(self, brand: str, model: str):
+        key = redis_db.canonical_key(brand, model)
+        if key in self._names:
+            return
+        self._names[key] = (brand.strip(), model.strip())
+        for term in self._terms_for(brand, model):
+            insort(self._terms, (term, key))
+        self._invalidate(brand, model)
+
+    def precompute_short_prefixes(self):
+        prefixes = {term[:n] for term, _ in self._terms for n in range(1, SHORT_PREFIX_LEN + 1)}
+        self._top = {prefix: [k for k, _, _ in self._scan(prefix, TOP_K)] for prefix in prefixes}
+
+    def swap(self, other: "PrefixIndex"):
+        """以重新建立的索引整個取代目前內容 (快取已過期的名稱會一併消失)"""
+        self._terms, self._names, self._popularity, self._top = other._terms, other._names, other._popularity, other._top
+
+    def set_popularity(self, key: str, score: float):
+        self._popularity[key] = score
+
+    def bump(self, brand: str, model: str, amount: float = 1):
+        key = redis_db.canonical_key(brand, model)
+        self._popularity[key] = self._popularity.get(key, 0) + amount
+        if key in self._names:
+            self._invalidate(*self._names[key])
+
+    def _scan(self, prefix: str, limit: int):
+        # 兩次 bisect 找出完整的 [lo, hi) 範圍，再依熱門度取前 limit 名
+        terms = self._terms
+        lo = bisect_left(terms, (prefix, ""))
+        hi = bisect_left(terms, (prefix[:-1] + chr(ord(prefix[-1]) + 1), ""), lo)
+        # dict.fromkeys 去重並保留字母順序，熱門度相同時依名稱排序
+        matched = dict.fromkeys(key for _, key in terms[lo:hi])
+        popularity = self._popularity
+        ranked = heapq.nlargest(limit, matched, key=lambda k: popularity.get(k, 0))
+        return [(k, *self._names[k]) for k in ranked]
+
+    def search(self, query: str, limit: int = 10):
+        """回傳 [(brand, model, popularity), ...]，依熱門度排序"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX_LEN and limit <= TOP_K:
+            cached = self._top.get(prefix)
+            if cached is None:
+                cached = [k for k, _, _ in self._scan(prefix, TOP_K)]
+                if cached:
+                    self._top[prefix] = cached
+            keys = cached[:limit]
+        else:
+            keys = [k for k, _, _ in self._scan(prefix, limit)]
+        return [(*self._names[k], self._popularity.get(k, 0)) for k in keys]
+
+
+autocomplete_index = PrefixIndex()
+
+
+def record_search(brand: str, model: str):
+    """
+    搜尋一次就累加熱門度 (本機立即生效，Redis 供其他 Pod 同步)
+    只計入索引中已知 (已快取) 的名稱，打錯字的查詢不會寫進 Redis
+    """
+    if redis_db.canonical_key(brand, model) not in autocomplete_index:
+        return
+    autocomplete_index.bump(brand, model)
+    try:
+        redis_db.client.zincrby(POPULARITY_KEY, 1, redis_db.canonical_key(brand, model))
+    except Exception as e:
+        logger.warning(f"Failed to record search popularity: {e}")
+
+
+async def rebuild_from_cache(index: PrefixIndex = None, batch_size: int = 500):
+    """
+    從 Redis rec:* keyspace 重新建立名稱索引並載入熱門度，完成後整個換上
+    rec:* key 只用來判斷哪些耳機仍有快取，顯示名稱取自 NAMES_KEY
+    """
+    index = autocomplete_index if index is None else index
+    fresh = PrefixIndex()
+    r = redis_db.async_client
+    keys = [redis_key[len("rec:"):] async for redis_key in r.scan_iter(match="rec:*", count=batch_size)]
+    names = {}
+    for i in range(0, len(keys), batch_size):
+        names.update(await redis_db.get_display_names(keys[i:i + batch_size]))
+    for key in keys:
+        # 沒有顯示名稱的舊快取才退回拆解 key (小寫)
+        brand, sep, model = key.partition(":")
+        if key in names:
+            brand, model = names[key]
+        elif not sep:
+            continue
+        fresh.add(brand, model)
+    await redis_db.prune_display_names(set(keys))
+
+    # 只保留前 N 名，避免熱門度 ZSET 無限成長
+    await r.zremrangebyrank(POPULARITY_KEY, 0, -settings.AUTOCOMPLETE_MAX_POPULAR - 1)
+    for key, score in await r.zrevrange(POPULARITY_KEY, 0, -1, withscores=True):
+        if key in fresh:
+            fresh.set_popularity(key, score)
+    fresh.precompute_short_prefixes()
+
+    index.swap(fresh)
+    return len(fresh)
+
+
+async def autocomplete_refresher(interval_seconds: int = None):
+    """背景排程：啟動時建立索引，之後定期重建 (收進其他 Pod 快取的新名稱、移除已過期的名稱)"""
+    interval = interval_seconds or settings.AUTOCOMPLETE_REFRESH_SECONDS
+    while True:
+        try:
+            total = await rebuild_from_cache()
+            logger.info(f"🔤 Autocomplete index rebuilt ({total} names)")
+        except Exception as e:
+            logger.error(f"❌ [Autocomplete Index Error] {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,237 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from src.core.config import settings
+from src.db import redis as redis_db
+from src.db.redis import canonical_key, set_cached_recommendation
+from src.db.mongo import log_request
+from src.services.recommendation_service import generate_recommendation
+from src.services.similarity_service import similarity_index
+from src.services.autocomplete_service import autocomplete_index, record_search
+
+# --- Redis key 設計 ---
+# job:{id}            Hash：status / brand / model / user_id / attempts / result / error / provisional
+# job:dedup:{key}     同一支耳機正在處理中的 job id (去重)
+# jobs:queue          等待中的 job id (LPUSH / BLMOVE)
+# jobs:processing     worker 已領取的 job id
+# jobs:inflight       ZSET，score = 可見性逾時的 deadline
+QUEUE_KEY = "jobs:queue"
+PROCESSING_KEY = "jobs:processing"
+INFLIGHT_KEY = "jobs:inflight"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+logger = logging.getLogger("uvicorn")
+
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _dedup_key(brand: str, model: str) -> str:
+    return f"job:dedup:{canonical_key(brand, model)}"
+
+
+async def enqueue_job(brand: str, model: str, user_id: str = None) -> str:
+    """建立分析 Job；同一支耳機已有 Job 在處理時直接回傳該 job id"""
+    r = redis_db.async_client
+    job_id = uuid.uuid4().hex
+    ttl = settings.JOB_RESULT_TTL_SECONDS
+
+    # SET NX 確保同一個 canonical key 只會有一個進行中的 Job
+    if not await r.set(_dedup_key(brand, model), job_id, nx=True, ex=ttl):
+        existing = await r.get(_dedup_key(brand, model))
+        if existing and await r.exists(_job_key(existing)):
+            return existing
+        await r.set(_dedup_key(brand, model), job_id, ex=ttl)
+
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_job_key(job_id), mapping={
+            "status": STATUS_QUEUED,
+            "brand": brand,
+            "model": model,
+            "user_id": user_id or "",
+            "attempts": 0,
+            "created_at": time.time(),
+        })
+        pipe.expire(_job_key(job_id), ttl)
+        pipe.lpush(QUEUE_KEY, job_id)
+        await pipe.execute()
+    return job_id
+
+
+async def get_job(job_id: str):
+    job = await redis_db.async_client.hgetall(_job_key(job_id))
+    if not job:
+        return None
+    for field in ("result", "provisional"):
+        if job.get(field):
+            job[field] = json.loads(job[field])
+    return job
+
+
+async def set_job_provisional(job_id: str, provisional: dict) -> dict:
+    """每個 Job 只存一次暫時答案 (HSETNX)，輪詢時直接讀取，不再重算；回傳實際存下的內容"""
+    r = redis_db.async_client
+    if await r.hsetnx(_job_key(job_id), "provisional", json.dumps(provisional)):
+        return provisional
+    stored = await r.hget(_job_key(job_id), "provisional")
+    return json.loads(stored) if stored else provisional
+
+
+async def wait_for_job(job_id: str, timeout: float, interval: float = 0.25):
+    """Long-polling：等到 Job 完成 / 失敗或逾時，回傳最新狀態"""
+    deadline = time.monotonic() + min(timeout, settings.JOB_POLL_MAX_WAIT_SECONDS)
+    job = await get_job(job_id)
+    while job and job["status"] not in (STATUS_DONE, STATUS_FAILED) and time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        job = await get_job(job_id)
+    return job
+
+
+async def _claim(block_seconds: int = 2):
+    r = redis_db.async_client
+    job_id = await r.blmove(QUEUE_KEY, PROCESSING_KEY, block_seconds, "RIGHT", "LEFT")
+    if not job_id:
+        return None
+    # Job hash 在排隊期間已過期：直接丟掉這個 id，避免 hset 重建出沒有 TTL、缺欄位的 hash
+    if not await r.exists(_job_key(job_id)):
+        await _discard(job_id)
+        return None
+    deadline = time.time() + settings.JOB_VISIBILITY_TIMEOUT_SECONDS
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.zadd(INFLIGHT_KEY, {job_id: deadline})
+        pipe.hset(_job_key(job_id), "status", STATUS_RUNNING)
+        pipe.hincrby(_job_key(job_id), "attempts", 1)
+        pipe.hgetall(_job_key(job_id))
+        results = await pipe.execute()
+    job = results[-1]
+    if "brand" not in job:
+        # exists 與 hset 之間剛好過期
+        await _discard(job_id)
+        return None
+    job["id"] = job_id
+    return job
+
+
+async def _discard(job_id: str):
+    async with redis_db.async_client.pipeline(transaction=True) as pipe:
+        pipe.delete(_job_key(job_id))
+        pipe.zrem(INFLIGHT_KEY, job_id)
+        pipe.lrem(PROCESSING_KEY, 0, job_id)
+        await pipe.execute()
+
+
+async def _ack(job: dict, status: str, result: dict = None, error: str = None):
+    r = redis_db.async_client
+    fields = {"status": status, "finished_at": time.time()}
+    if result is not None:
+        fields["result"] = json.dumps(result)
+    if error:
+        fields["error"] = error
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_job_key(job["id"]), mapping=fields)
+        # 結果從完成時起保留 JOB_RESULT_TTL_SECONDS，而不是從排入時起算
+        pipe.expire(_job_key(job["id"]), settings.JOB_RESULT_TTL_SECONDS)
+        pipe.zrem(INFLIGHT_KEY, job["id"])
+        pipe.lrem(PROCESSING_KEY, 0, job["id"])
+        # 結束後釋放去重 key，下一次查詢會先走快取
+        pipe.delete(_dedup_key(job["brand"], job["model"]))
+        await pipe.execute()
+
+
+async def _retry(job: dict, error: str):
+    """還有重試額度就放回佇列，否則標記失敗"""
+    if int(job.get("attempts", 0)) >= settings.JOB_MAX_ATTEMPTS:
+        await _ack(job, STATUS_FAILED, error=error)
+        return
+    r = redis_db.async_client
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_job_key(job["id"]), mapping={"status": STATUS_QUEUED, "error": error})
+        pipe.zrem(INFLIGHT_KEY, job["id"])
+        pipe.lrem(PROCESSING_KEY, 0, job["id"])
+        pipe.lpush(QUEUE_KEY, job["id"])
+        await pipe.execute()
+
+
+async def process_job(job: dict):
+    try:
+        result, should_cache = await generate_recommendation(job["brand"], job["model"])
+    except Exception as e:
+        logger.error(f"❌ [Job Error] {job['id']}: {e}")
+        await _retry(job, str(e))
+        return
+
+    # 上游暫時失敗 (預設內容) 時先重試，最後一次才把預設內容當作結果
+    if not should_cache and int(job.get("attempts", 0)) < settings.JOB_MAX_ATTEMPTS:
+        await _retry(job, "upstream unavailable")
+        return
+
+    if should_cache:
+        set_cached_recommendation(job["brand"], job["model"], result)
+        similarity_index.add(job["brand"], job["model"], result)
+        autocomplete_index.add(job["brand"], job["model"])
+        record_search(job["brand"], job["model"])
+    await _ack(job, STATUS_DONE, result=result)
+    await log_request("search_headphone", {"brand": job["brand"], "model": job["model"], "result": result["title"]}, job.get("user_id") or None)
+
+
+async def requeue_expired():
+    """可見性逾時：worker 領取後超過 deadline 未完成 (例如 Pod 被砍) 的 Job 重新排入"""
+    r = redis_db.async_client
+    now = time.time()
+    for job_id in await r.zrangebyscore(INFLIGHT_KEY, 0, now):
+        job = await r.hgetall(_job_key(job_id))
+        if "brand" not in job:
+            # Job 本身已過期 (或只剩殘缺的 hash)，只需清理索引
+            await _discard(job_id)
+            continue
+        job["id"] = job_id
+        logger.warning(f"⏰ Job {job_id} 逾時，重新排入佇列")
+        await _retry(job, "visibility timeout")
+
+    # 領取後、寫入 inflight 前就中斷的 Job 沒有 deadline，補上一個讓它之後會被回收
+    for job_id in await r.lrange(PROCESSING_KEY, 0, -1):
+        if await r.zscore(INFLIGHT_KEY, job_id) is None:
+            await r.zadd(INFLIGHT_KEY, {job_id: now + settings.JOB_VISIBILITY_TIMEOUT_SECONDS}, nx=True)
+
+
+async def _worker_loop(worker_id: int):
+    while True:
+        try:
+            job = await _claim()
+            if job:
+                await process_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ [Worker {worker_id}] {e}")
+            await asyncio.sleep(1)
+
+
+async def _reaper_loop(interval: int = 5):
+    while True:
+        try:
+            await requeue_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ [Job Reaper] {e}")
+        await asyncio.sleep(interval)
+
+
+async def run_workers(concurrency: int = None):
+    """啟動 worker pool 與逾時回收 (in-process 或 `python -m src.cli.worker`)"""
+    concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+    tasks = [asyncio.create_task(_worker_loop(i)) for i in range(concurrency)]
+    tasks.append(asyncio.create_task(_reaper_loop()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
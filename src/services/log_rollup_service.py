@@ -0,0 +1,98 @@
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from src.core.config import settings
+from src.db import mongo
+from src.db import redis as redis_db
+
+# 彙總結果存放的 collection (一般 collection，不受 logs 的 TTL 影響)
+ROLLUP_COLLECTIONS = {
+    "hour": "logs_rollup_hourly",
+    "day": "logs_rollup_daily",
+}
+
+# 每個排程週期只讓一個 Pod 執行彙總 (SET NX EX)
+LEASE_KEY = "logs:rollup:lease"
+
+
+def _truncate(ts: datetime, unit: str) -> datetime:
+    if unit == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def build_rollup_pipeline(unit: str, start: datetime, end: datetime) -> list:
+    """依 brand / model / event 彙總 [start, end) 區間的 logs，並 $merge 進 rollup collection"""
+    return [
+        {"$match": {mongo.LOG_TIME_FIELD: {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateTrunc": {"date": f"${mongo.LOG_TIME_FIELD}", "unit": unit}},
+                "brand": {"$toLower": {"$ifNull": ["$data.brand", ""]}},
+                "model": {"$toLower": {"$ifNull": ["$data.model", ""]}},
+                "event": f"${mongo.LOG_META_FIELD}.event",
+            },
+            "count": {"$sum": 1},
+            "users": {"$addToSet": f"${mongo.LOG_META_FIELD}.user_id"},
+        }},
+        {"$project": {
+            "_id": 1,
+            "bucket": "$_id.bucket",
+            "brand": "$_id.brand",
+            "model": "$_id.model",
+            "event": "$_id.event",
+            "count": 1,
+            # 匿名使用者 (None) 不計入不重複人數
+            "unique_users": {"$size": {"$setDifference": ["$users", [None]]}},
+            "updated_at": "$$NOW",
+        }},
+        # 以 _id (bucket + brand + model + event) 覆寫，重跑同一區間是冪等的
+        {"$merge": {"into": ROLLUP_COLLECTIONS[unit], "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+async def run_rollup(unit: str, now: datetime = None, lookback: int = 2):
+    """重算最近 lookback 個 bucket (含目前尚未結束的 bucket)"""
+    database = mongo.get_database()
+    if database is None:
+        print("⚠️ Warning: MongoDB 尚未連線，略過 Log 彙總")
+        return
+
+    now = now or datetime.utcnow()
+    step = timedelta(hours=1) if unit == "hour" else timedelta(days=1)
+    end = _truncate(now, unit) + step
+    start = end - step * lookback
+
+    cursor = database[mongo.LOGS_COLLECTION].aggregate(build_rollup_pipeline(unit, start, end))
+    # $merge 不回傳文件，仍需消耗 cursor 讓 pipeline 執行完成
+    await cursor.to_list(length=None)
+
+
+def _lookback(unit: str, now: datetime) -> int:
+    # 每日彙總只在當天第一個小時補算前一天 (晚到的 log)，其餘時間只重算今天
+    if unit == "day":
+        return 2 if now.hour == 0 else 1
+    return 2
+
+
+async def acquire_lease(interval_seconds: int) -> bool:
+    """取得本週期的執行權；Redis 無法使用時照常執行 ($merge 重跑是冪等的)"""
+    try:
+        return bool(await redis_db.async_client.set(LEASE_KEY, socket.gethostname(), nx=True, ex=interval_seconds))
+    except Exception as e:
+        print(f"⚠️ Warning: 無法取得 Rollup lease ({e})，仍執行彙總")
+        return True
+
+
+async def rollup_scheduler(interval_seconds: int = None):
+    """背景排程：定期更新每小時 / 每日彙總 (main.py lifespan 啟動，LOG_ROLLUP_ENABLED 控制)"""
+    interval = interval_seconds or settings.LOG_ROLLUP_INTERVAL_SECONDS
+    while True:
+        if await acquire_lease(interval):
+            now = datetime.utcnow()
+            for unit in ROLLUP_COLLECTIONS:
+                try:
+                    await run_rollup(unit, now=now, lookback=_lookback(unit, now))
+                except Exception as e:
+                    print(f"❌ [Rollup Error] {unit}: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,59 @@
+import asyncio
+from src.services.ai_service import analyze_headphone
+from src.services.music_service import search_track
+from src.services.similarity_service import similarity_index
+
+FALLBACK_AI_DATA = {"specs": {}, "sound_features": [], "song_query": "Hotel California - Eagles", "detailed_analysis": {}, "summary": "AI Busy"}
+
+async def similar_fallback(brand: str, model: str):
+    """Gemini 失敗時改用最相近 (分數超過 SIMILARITY_MIN_SCORE) 的已快取結果，沒有則回傳 None"""
+    hits = await asyncio.to_thread(similarity_index.query, brand, model, 1)
+    if not hits:
+        return None
+    similar_brand, similar_model, _, rec = hits[0]
+    return {**rec, "comment": f"AI 忙碌中，先提供相近耳機 {similar_brand} {similar_model} 的分析"}
+
+async def generate_recommendation(brand: str, model: str):
+    """
+    冷路徑：Gemini 分析 + Spotify 搜尋 + 組裝結果
+    回傳 (result, should_cache)；任一上游失敗時回傳相近耳機或預設內容且 should_cache=False
+    """
+    # 1. AI Analysis
+    ai_data = await analyze_headphone(brand, model)
+    should_cache = True
+
+    if not ai_data:
+        fallback = await similar_fallback(brand, model)
+        if fallback:
+            return fallback, False
+        should_cache = False
+        ai_data = dict(FALLBACK_AI_DATA)
+
+    # 2. Spotify Search
+    track = await search_track(ai_data["song_query"])
+    if not track:
+        should_cache = False
+        track = {"name": ai_data["song_query"], "artists": [{"name": "Unknown"}], "album": {"images": [{"url": ""}]}, "external_urls": {"spotify": "#"}, "id": "unknown"}
+
+    # 3. Assembly
+    analysis = ai_data.get("detailed_analysis", {})
+    result = {
+        "form_factor": ai_data.get("specs", {}).get("form_factor", "N/A"),
+        "connection": ai_data.get("specs", {}).get("connection", "N/A"),
+        "release_year": ai_data.get("specs", {}).get("year", "N/A"),
+        "price_range": ai_data.get("specs", {}).get("price", "N/A"),
+        "driver_config": ai_data.get("specs", {}).get("driver", "N/A"),
+        "sound_features": ai_data.get("sound_features", []),
+        "analysis_bass": analysis.get("bass", "N/A"),
+        "analysis_mids": analysis.get("mids", "N/A"),
+        "analysis_highs": analysis.get("highs", "N/A"),
+        "listening_guide": analysis.get("guide", "N/A"),
+        "title": track["name"],
+        "artist": track["artists"][0]["name"],
+        "comment": ai_data.get("summary", ""),
+        "cover_url": track["album"]["images"][0]["url"] if track["album"]["images"] else "",
+        "spotify_url": track["external_urls"]["spotify"],
+        "track_id": track["id"],
+        "preview_url": track.get("preview_url")
+    }
+    return result, should_cache
@@ -0,0 +1,225 @@
+import re
+import json
+import zlib
+import asyncio
+import logging
+import numpy as np
+from src.core.config import settings
+from src.db import redis as redis_db
+
+logger = logging.getLogger("uvicorn")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+
+# 各欄位的權重：型號名稱與特色標籤比長篇描述更有鑑別度
+NAME_WEIGHT = 2.0
+TAG_WEIGHT = 1.5
+SPEC_WEIGHT = 1.0
+TEXT_WEIGHT = 0.5
+
+
+def _tokens(text: str):
+    """英數字取單字，中文取 bigram (沒有斷詞器也能比對)"""
+    text = (text or "").lower()
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run[i:i + 2] for i in range(max(len(run) - 1, 1)))
+    return tokens
+
+
+def _char_ngrams(text: str, n: int = 3):
+    """型號的字元 trigram，讓 HD650 / HD660S 這類相近型號也能命中"""
+    compact = re.sub(r"[^a-z0-9]", "", (text or "").lower())
+    if len(compact) <= n:
+        return [compact] if compact else []
+    return [compact[i:i + n] for i in range(len(compact) - n + 1)]
+
+
+def name_features(brand: str, model: str):
+    return [("brand:" + t, NAME_WEIGHT) for t in _tokens(brand)] + \
+        [("model:" + t, NAME_WEIGHT) for t in _tokens(model)] + \
+        [("mgram:" + g, NAME_WEIGHT / 2) for g in _char_ngrams(model)]
+
+
+def recommendation_features(brand: str, model: str, rec: dict):
+    features = name_features(brand, model)
+    for tag in rec.get("sound_features", []):
+        features.append(("tag:" + tag.strip().lower(), TAG_WEIGHT))
+        features.extend(("tagtok:" + t, TAG_WEIGHT / 2) for t in _tokens(tag))
+    for field in ("form_factor", "connection", "driver_config", "price_range"):
+        features.extend((f"{field}:" + t, SPEC_WEIGHT) for t in _tokens(rec.get(field, "")))
+    for field in ("analysis_bass", "analysis_mids", "analysis_highs"):
+        features.extend((f"{field}:" + t, TEXT_WEIGHT) for t in _tokens(rec.get(field, "")))
+    return features
+
+
+def vectorize(features, dim: int) -> np.ndarray:
+    """Hashed bag-of-words：crc32 決定維度與正負號，log(1+tf) 後做 L2 normalize"""
+    vec = np.zeros(dim, dtype=np.float32)
+    for token, weight in features:
+        h = zlib.crc32(token.encode("utf-8"))
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        vec[h % dim] += sign * weight
+    vec = np.sign(vec) * np.log1p(np.abs(vec))
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class SimilarityIndex:
+    """
+    快取推薦結果的相似度索引 (記憶體內 NumPy 矩陣)
+    每列為一支耳機的單位向量，cosine similarity 即為內積。
+    狀態放在單一 tuple 裡，查詢可以丟到 thread 執行而不會讀到換到一半的索引。
+    """
+
+    def __init__(self, dim: int = 1024, max_entries: int = 5000, min_score: float = 0.0, initial_capacity: int = 256):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.min_score = min_score
+        matrix = np.zeros((min(initial_capacity, max_entries), dim), dtype=np.float32)
+        # (matrix, row -> canonical key, canonical key -> row, canonical key -> (brand, model, recommendation))
+        self._state = (matrix, [], {}, {})
+
+    def __len__(self):
+        return len(self._state[1])
+
+    def __contains__(self, key: str):
+        return key in self._state[2]
+
+    def _ensure_capacity(self):
+        matrix, keys, rows, docs = self._state
+        if len(keys) < matrix.shape[0]:
+            return
+        grown = np.zeros((min(matrix.shape[0] * 2, self.max_entries), self.dim), dtype=np.float32)
+        grown[:len(keys)] = matrix[:len(keys)]
+        self._state = (grown, keys, rows, docs)
+
+    def add(self, brand: str, model: str, rec: dict, vector: np.ndarray = None) -> bool:
+        """新增或更新一筆 (重複的 key 直接覆寫該列)；已達 max_entries 時略過新 key"""
+        key = redis_db.canonical_key(brand, model)
+        _, keys, rows, docs = self._state
+        row = rows.get(key)
+        if row is None and len(keys) >= self.max_entries:
+            return False
+        if vector is None:
+            vector = vectorize(recommendation_features(brand, model, rec), self.dim)
+        if row is None:
+            self._ensure_capacity()
+            row = len(keys)
+            keys.append(key)
+            rows[key] = row
+        self._state[0][row] = vector
+        docs[key] = (brand, model, rec)
+        return True
+
+    def vector_if_unchanged(self, key: str, rec: dict):
+        """重建索引時沿用內容沒變的向量，不必重新計算"""
+        matrix, _, rows, docs = self._state
+        row = rows.get(key)
+        if row is not None and docs[key][2] == rec:
+            return matrix[row].copy()
+        return None
+
+    def swap(self, other: "SimilarityIndex"):
+        """以重新建立的索引整個取代目前內容 (已過期的快取會一併消失)"""
+        self._state = other._state
+
+    def vector_for(self, brand: str, model: str) -> np.ndarray:
+        """已索引的耳機用完整向量；沒看過的型號只能用名稱特徵查詢"""
+        matrix, _, rows, _ = self._state
+        row = rows.get(redis_db.canonical_key(brand, model))
+        if row is not None:
+            return matrix[row]
+        return vectorize(name_features(brand, model), self.dim)
+
+    def query_many(self, queries: np.ndarray, k: int = 5, exclude=None):
+        """
+        批次 top-k：queries 為 (q, dim) 矩陣，回傳每個查詢的 [(brand, model, score, rec), ...]
+        分數未超過 min_score 的結果不回傳
+        """
+        matrix, keys, rows, docs = self._state
+        size = min(len(keys), matrix.shape[0])
+        if size == 0:
+            return [[] for _ in range(len(queries))]
+        exclude = exclude or [None] * len(queries)
+        scores = np.atleast_2d(queries) @ matrix[:size].T
+        results = []
+        for i, row_scores in enumerate(scores):
+            skip = rows.get(exclude[i])
+            if skip is not None and skip < size:
+                row_scores[skip] = -np.inf
+            top = min(k, size)
+            idx = np.argpartition(-row_scores, top - 1)[:top]
+            idx = idx[np.argsort(-row_scores[idx])]
+            hits = []
+            for j in idx:
+                if not np.isfinite(row_scores[j]) or row_scores[j] <= self.min_score:
+                    continue
+                brand, model, rec = docs[keys[j]]
+                hits.append((brand, model, float(row_scores[j]), rec))
+            results.append(hits)
+        return results
+
+    def query(self, brand: str, model: str, k: int = 5):
+        """查詢與某支耳機最相近的已快取耳機 (排除自己)"""
+        key = redis_db.canonical_key(brand, model)
+        return self.query_many(self.vector_for(brand, model)[None, :], k, exclude=[key])[0]
+
+
+similarity_index = SimilarityIndex(
+    dim=settings.SIMILARITY_DIM, max_entries=settings.SIMILARITY_MAX_ENTRIES, min_score=settings.SIMILARITY_MIN_SCORE,
+)
+
+
+async def rebuild_from_cache(index: SimilarityIndex = None, batch_size: int = 500):
+    """
+    以 SCAN rec:* 重新建立索引後整個換上 (啟動時與定期執行)
+    已過期的快取因此會從索引消失；內容沒變的項目沿用舊向量
+    """
+    index = similarity_index if index is None else index
+    fresh = SimilarityIndex(dim=index.dim, max_entries=index.max_entries, min_score=index.min_score)
+    r = redis_db.async_client
+    pending = []
+
+    async def flush():
+        values = await r.mget(pending)
+        names = await redis_db.get_display_names([redis_key[len("rec:"):] for redis_key in pending])
+        for redis_key, raw in zip(pending, values):
+            if not raw:
+                continue
+            key = redis_key[len("rec:"):]
+            try:
+                # 沒有顯示名稱的舊快取才退回拆解 key (小寫)
+                brand, model = names.get(key) or key.split(":", 1)
+                rec = json.loads(raw)
+                fresh.add(brand, model, rec, vector=index.vector_if_unchanged(key, rec))
+            except (ValueError, json.JSONDecodeError) as e:
+                logger.warning(f"Skip {redis_key} in similarity index: {e}")
+        pending.clear()
+        # 讓出 event loop，避免大量向量化時卡住請求
+        await asyncio.sleep(0)
+
+    async for redis_key in r.scan_iter(match="rec:*", count=batch_size):
+        if len(fresh) >= fresh.max_entries:
+            break
+        pending.append(redis_key)
+        if len(pending) >= batch_size:
+            await flush()
+    if pending:
+        await flush()
+
+    index.swap(fresh)
+    return len(fresh)
+
+
+async def similarity_refresher(interval_seconds: int = None):
+    """背景排程：定期重建，收進其他 Pod / worker 寫入的快取並移除已過期的項目"""
+    interval = interval_seconds or settings.SIMILARITY_REFRESH_SECONDS
+    while True:
+        try:
+            total = await rebuild_from_cache()
+            logger.info(f"🔎 Similarity index rebuilt ({total} entries)")
+        except Exception as e:
+            logger.error(f"❌ [Similarity Index Error] {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,75 @@
+import pytest
+from types import SimpleNamespace
+from prometheus_client import REGISTRY
+from src.services import ai_service
+from src.services.ai_service import build_analysis_schema, _generate_json
+
+def test_schema_applies_length_caps(monkeypatch):
+    monkeypatch.setattr(ai_service.settings, "GEMINI_MAX_ANALYSIS_CHARS", 50)
+    monkeypatch.setattr(ai_service.settings, "GEMINI_MAX_FEATURES", 3)
+    schema = build_analysis_schema()
+
+    assert schema.required == ["specs", "sound_features", "detailed_analysis", "song_query", "summary"]
+    assert schema.properties["detailed_analysis"].properties["bass"].max_length == 50
+    assert schema.properties["sound_features"].max_items == 3
+    assert "brand" in build_analysis_schema(with_identity=True).properties
+
+def _fake_client(texts):
+    responses = iter(texts)
+
+    async def generate_content(**kwargs):
+        usage = SimpleNamespace(prompt_token_count=40, candidates_token_count=120, thoughts_token_count=0)
+        return SimpleNamespace(text=next(responses), usage_metadata=usage)
+
+    return SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+@pytest.mark.asyncio
+async def test_usage_exported_and_truncated_output_retried(monkeypatch):
+    async def no_sleep(_):
+        return None
+    monkeypatch.setattr(ai_service.asyncio, "sleep", no_sleep)
+
+    before_prompt = _sample("gemini_tokens_total", kind="prompt", mode="single")
+    before_parse_errors = _sample("gemini_calls_total", mode="single", outcome="parse_error")
+
+    data = await _generate_json(_fake_client(['{"summary": "cut', '{"summary": "ok"}']), "p", build_analysis_schema(), 256)
+
+    assert data == {"summary": "ok"}
+    assert _sample("gemini_tokens_total", kind="prompt", mode="single") - before_prompt == 80
+    assert _sample("gemini_calls_total", mode="single", outcome="parse_error") - before_parse_errors == 1
+
+def _string_caps(schema):
+    """schema 中所有字串欄位可能輸出的最大字數總和"""
+    if schema.type == ai_service.types.Type.STRING:
+        return schema.max_length
+    if schema.type == ai_service.types.Type.ARRAY:
+        return schema.max_items * _string_caps(schema.items)
+    return sum(_string_caps(prop) for prop in schema.properties.values())
+
+@pytest.mark.parametrize("analysis_chars", [150, 400])
+def test_output_token_cap_covers_field_caps(monkeypatch, analysis_chars):
+    monkeypatch.setattr(ai_service.settings, "GEMINI_MAX_ANALYSIS_CHARS", analysis_chars)
+    monkeypatch.setattr(ai_service.settings, "GEMINI_THINKING_BUDGET", 0)
+    headroom = ai_service.settings.GEMINI_OUTPUT_TOKEN_HEADROOM
+    assert headroom > 1
+
+    # 每個字最多算 1 token，填滿所有欄位上限仍要留有 headroom
+    assert ai_service.output_token_cap() >= _string_caps(build_analysis_schema()) * headroom
+    batch_chars = 3 * _string_caps(build_analysis_schema(with_identity=True))
+    assert ai_service.output_token_cap(3, with_identity=True) >= batch_chars * headroom
+
+@pytest.mark.parametrize("batch", [1, 3])
+def test_output_token_cap_includes_thinking_budget(monkeypatch, batch):
+    monkeypatch.setattr(ai_service.settings, "GEMINI_THINKING_BUDGET", 0)
+    base = ai_service.output_token_cap(batch, with_identity=batch > 1)
+
+    # thinking token 與回應共用 max_output_tokens，預算要整個加上去
+    monkeypatch.setattr(ai_service.settings, "GEMINI_THINKING_BUDGET", 512)
+    assert ai_service.output_token_cap(batch, with_identity=batch > 1) == base + 512
+
+    # 動態 thinking 無法預估用量，不設上限
+    monkeypatch.setattr(ai_service.settings, "GEMINI_THINKING_BUDGET", -1)
+    assert ai_service.output_token_cap(batch, with_identity=batch > 1) is None
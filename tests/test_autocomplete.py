@@ -0,0 +1,112 @@
+import json
+import pytest
+from fakeredis import FakeAsyncRedis
+from src.services import autocomplete_service
+from src.db.redis import NAMES_KEY
+from src.services.autocomplete_service import PrefixIndex, POPULARITY_KEY, rebuild_from_cache, record_search
+
+def test_prefix_search_ranked_by_popularity():
+    index = PrefixIndex()
+    index.add("Sennheiser", "HD650")
+    index.add("Sennheiser", "HD600")
+    index.add("Sony", "WH-1000XM5")
+    index.set_popularity("sennheiser:hd600", 10)
+    index.bump("Sennheiser", "HD650")
+
+    assert [m for _, m, _ in index.search("senn")] == ["HD600", "HD650"]
+    # 空白 / 符號不影響比對，也能直接從型號開頭找
+    assert [m for _, m, _ in index.search("Sennheiser HD 65")] == ["HD650"]
+    assert [m for _, m, _ in index.search("wh1000")] == ["WH-1000XM5"]
+    assert index.search("akg") == []
+
+def test_add_is_idempotent_and_limit_applies():
+    index = PrefixIndex()
+    for i in range(5):
+        index.add("Brand", f"M{i}")
+        index.add("brand", f"m{i}")
+    assert len(index) == 5
+    assert len(index.search("brand", limit=3)) == 3
+
+def test_short_prefix_considers_every_match():
+    index = PrefixIndex()
+    for i in range(600):
+        index.add("Sennheiser", f"HD{i:03d}")
+    index.add("Sony", "WH-1000XM5")
+    index.set_popularity("sony:wh-1000xm5", 1000)
+
+    top = index.search("s", 3)
+    assert top[0] == ("Sony", "WH-1000XM5", 1000)
+    assert [m for _, m, _ in top[1:]] == ["HD000", "HD001"]
+
+@pytest.mark.asyncio
+async def test_rebuild_drops_expired_names_and_trims_popularity(monkeypatch):
+    r = FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(autocomplete_service.redis_db, "async_client", r)
+    monkeypatch.setattr(autocomplete_service.settings, "AUTOCOMPLETE_MAX_POPULAR", 2)
+    index = PrefixIndex()
+    index.add("Sony", "MDR-7506")  # 快取已過期
+
+    await r.set("rec:akg:k371", "{}")
+    await r.hset(NAMES_KEY, mapping={"akg:k371": json.dumps(["AKG", "K371"]), "sony:mdr-7506": json.dumps(["Sony", "MDR-7506"])})
+    await r.zadd(POPULARITY_KEY, {"akg:k371": 5, "a:b": 3, "x:y": 1})
+
+    assert await rebuild_from_cache(index) == 1
+    assert index.search("sony") == []
+    # 顯示名稱保留原本的大小寫，過期的名稱一併清掉
+    assert index.search("k3") == [("AKG", "K371", 5)]
+    assert await r.hkeys(NAMES_KEY) == ["akg:k371"]
+    assert await r.zrange(POPULARITY_KEY, 0, -1) == ["a:b", "akg:k371"]
+    await r.aclose()
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_brands_with_colons(monkeypatch):
+    r = FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(autocomplete_service.redis_db, "async_client", r)
+    await r.set("rec:a:b:c1", "{}")
+    await r.hset(NAMES_KEY, "a:b:c1", json.dumps(["A:B", "C1"]))
+    await r.set("rec:legacy:x1", "{}")  # 沒有顯示名稱的舊快取
+
+    index = PrefixIndex()
+    await rebuild_from_cache(index)
+    assert index.search("ab") == [("A:B", "C1", 0)]
+    assert index.search("legacy") == [("legacy", "x1", 0)]
+    await r.aclose()
+
+def test_record_search_ignores_unknown_names(monkeypatch):
+    calls = []
+    monkeypatch.setattr(autocomplete_service.redis_db.client, "zincrby", lambda *args: calls.append(args))
+    index = PrefixIndex()
+    index.add("AKG", "K371")
+    monkeypatch.setattr(autocomplete_service, "autocomplete_index", index)
+
+    record_search("AKG", "K37l")  # 打錯字
+    record_search("akg", "k371")
+
+    assert calls == [(POPULARITY_KEY, 1, "akg:k371")]
+
+def test_precomputed_short_prefixes_match_full_scan():
+    index = PrefixIndex()
+    for i in range(200):
+        index.add(f"Brand{i % 7}", f"Model{i}")
+        index.set_popularity(f"brand{i % 7}:model{i}", i % 13)
+    expected = index.search("b", 10)
+    index.precompute_short_prefixes()
+    assert index.search("b", 10) == expected
+
+    # 新增的名稱會讓相關短前綴改回即時掃描
+    index.add("Bose", "QC45")
+    index.set_popularity("bose:qc45", 100)
+    assert index.search("b", 1) == [("Bose", "QC45", 100)]
+
+def test_bump_reorders_precomputed_prefixes():
+    index = PrefixIndex()
+    index.add("Sennheiser", "HD600")
+    index.add("Sennheiser", "HD650")
+    index.set_popularity("sennheiser:hd600", 2)
+    index.precompute_short_prefixes()
+
+    for _ in range(3):
+        index.bump("Sennheiser", "HD650")
+    results = index.search("s", 2)
+    # 回傳的熱門度與排序一致
+    assert results == [("Sennheiser", "HD650", 3), ("Sennheiser", "HD600", 2)]
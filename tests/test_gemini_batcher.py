@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from google.genai import types
+from src.services import ai_service
+from src.services.ai_service import GeminiBatcher
+
+@pytest.mark.asyncio
+async def test_batcher_merges_misses_and_falls_back(monkeypatch):
+    batch_calls, single_calls = [], []
+
+    async def fake_batch(items):
+        batch_calls.append(items)
+        # 模擬批次回應漏掉其中一支
+        return {"sony:mdr-7506": {"summary": "batch"}}
+
+    async def fake_single(brand, model):
+        single_calls.append((brand, model))
+        return {"summary": "single"}
+
+    monkeypatch.setattr(ai_service, "_analyze_batch", fake_batch)
+    monkeypatch.setattr(ai_service, "_analyze_single", fake_single)
+
+    batcher = GeminiBatcher(window_seconds=0.05, max_size=10)
+    results = await asyncio.gather(
+        batcher.submit("Sony", "MDR-7506"),
+        batcher.submit("sony", "mdr-7506 "),  # 同一支耳機只送一次
+        batcher.submit("AKG", "K371"),
+    )
+
+    assert len(batch_calls) == 1 and len(batch_calls[0]) == 2
+    assert single_calls == [("AKG", "K371")]
+    assert [r["summary"] for r in results] == ["batch", "batch", "single"]
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_at_max_size(monkeypatch):
+    async def fake_batch(items):
+        return {f"b:{model.lower()}": {"model": model} for _, model in items}
+
+    monkeypatch.setattr(ai_service, "_analyze_batch", fake_batch)
+
+    # window 很長，達到 max_size 就必須立刻送出
+    batcher = GeminiBatcher(window_seconds=60, max_size=2)
+    results = await asyncio.wait_for(asyncio.gather(batcher.submit("B", "X"), batcher.submit("B", "Y")), timeout=1)
+    assert [r["model"] for r in results] == ["X", "Y"]
+
+@pytest.mark.asyncio
+async def test_failing_batch_is_tried_once_before_fallback(monkeypatch):
+    calls = []
+
+    async def generate_content(**kwargs):
+        calls.append(kwargs["config"].response_schema.type)
+        raise RuntimeError("upstream down")
+
+    fake_client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(ai_service, "_get_client", lambda: fake_client)
+    monkeypatch.setattr(ai_service.asyncio, "sleep", fake_sleep)
+
+    assert await ai_service._analyze_batch([("Sony", "MDR-7506"), ("AKG", "K371")]) == {}
+    # 批次只呼叫一次、不等待，失敗後由呼叫端立刻改走逐項呼叫
+    assert calls == [types.Type.ARRAY]
+    assert sleeps == []
@@ -0,0 +1,136 @@
+import time
+import pytest
+import pytest_asyncio
+from fakeredis import FakeAsyncRedis
+from src.services import job_service
+from src.services.job_service import (
+    enqueue_job, get_job, process_job, requeue_expired, set_job_provisional, _claim,
+    QUEUE_KEY, PROCESSING_KEY, INFLIGHT_KEY, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED,
+)
+
+RESULT = {"title": "Hotel California"}
+
+class _NullIndex:
+    def add(self, *args):
+        pass
+
+@pytest_asyncio.fixture
+async def fake_redis(monkeypatch):
+    r = FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(job_service.redis_db, "async_client", r)
+    monkeypatch.setattr(job_service, "set_cached_recommendation", lambda *args: None)
+    monkeypatch.setattr(job_service, "similarity_index", _NullIndex())
+    monkeypatch.setattr(job_service, "autocomplete_index", _NullIndex())
+    monkeypatch.setattr(job_service, "record_search", lambda *args: None)
+    monkeypatch.setattr(job_service.settings, "JOB_MAX_ATTEMPTS", 2)
+
+    async def no_log(*args, **kwargs):
+        return None
+    monkeypatch.setattr(job_service, "log_request", no_log)
+    yield r
+    await r.aclose()
+
+def _upstream(monkeypatch, outcomes):
+    """依序回傳 outcomes：Exception 會被拋出，其餘當作 (result, should_cache)"""
+    calls = iter(outcomes)
+
+    async def generate(brand, model):
+        outcome = next(calls)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    monkeypatch.setattr(job_service, "generate_recommendation", generate)
+
+@pytest.mark.asyncio
+async def test_enqueue_dedups_by_canonical_key(fake_redis):
+    first = await enqueue_job("Sennheiser", "HD650")
+    second = await enqueue_job(" sennheiser", "hd650 ")
+    other = await enqueue_job("Sony", "MDR-7506")
+
+    assert first == second != other
+    assert await fake_redis.llen(QUEUE_KEY) == 2
+
+@pytest.mark.asyncio
+async def test_process_job_retries_then_succeeds(fake_redis, monkeypatch):
+    _upstream(monkeypatch, [RuntimeError("gemini down"), (RESULT, True)])
+    job_id = await enqueue_job("AKG", "K371")
+
+    await process_job(await _claim(block_seconds=1))
+    job = await get_job(job_id)
+    assert job["status"] == STATUS_QUEUED and job["error"] == "gemini down"
+    assert await fake_redis.llen(QUEUE_KEY) == 1
+
+    # 模擬排隊很久：hash 只剩幾秒就會過期
+    await fake_redis.expire(f"job:{job_id}", 5)
+    await process_job(await _claim(block_seconds=1))
+    job = await get_job(job_id)
+    assert job["status"] == STATUS_DONE and job["result"] == RESULT
+    assert await fake_redis.llen(PROCESSING_KEY) == 0
+    assert await fake_redis.zcard(INFLIGHT_KEY) == 0
+    # 完成後重新計算結果的保留時間，並釋放去重 key
+    assert await fake_redis.ttl(f"job:{job_id}") > job_service.settings.JOB_RESULT_TTL_SECONDS - 5
+    assert await enqueue_job("AKG", "K371") != job_id
+
+@pytest.mark.asyncio
+async def test_process_job_fails_after_max_attempts(fake_redis, monkeypatch):
+    _upstream(monkeypatch, [RuntimeError("boom"), RuntimeError("boom")])
+    job_id = await enqueue_job("AKG", "K371")
+
+    for _ in range(2):
+        await process_job(await _claim(block_seconds=1))
+
+    job = await get_job(job_id)
+    assert job["status"] == STATUS_FAILED and job["error"] == "boom"
+    assert await fake_redis.llen(QUEUE_KEY) == 0
+
+@pytest.mark.asyncio
+async def test_fallback_result_is_retried_before_being_accepted(fake_redis, monkeypatch):
+    fallback = {"title": "fallback"}
+    _upstream(monkeypatch, [(fallback, False), (fallback, False)])
+    job_id = await enqueue_job("AKG", "K371")
+
+    await process_job(await _claim(block_seconds=1))
+    assert (await get_job(job_id))["status"] == STATUS_QUEUED
+    await process_job(await _claim(block_seconds=1))
+    job = await get_job(job_id)
+    assert job["status"] == STATUS_DONE and job["result"] == fallback
+
+@pytest.mark.asyncio
+async def test_requeue_expired_returns_job_to_queue(fake_redis):
+    job_id = await enqueue_job("AKG", "K371")
+    await _claim(block_seconds=1)
+    # 模擬 worker 領取後當機：deadline 已過
+    await fake_redis.zadd(INFLIGHT_KEY, {job_id: time.time() - 1})
+
+    await requeue_expired()
+
+    assert await fake_redis.lrange(QUEUE_KEY, 0, -1) == [job_id]
+    assert await fake_redis.llen(PROCESSING_KEY) == 0
+    assert (await get_job(job_id))["status"] == STATUS_QUEUED
+
+@pytest.mark.asyncio
+async def test_requeue_expired_cleans_up_vanished_jobs(fake_redis):
+    await fake_redis.lpush(PROCESSING_KEY, "gone")
+    await fake_redis.zadd(INFLIGHT_KEY, {"gone": time.time() - 1})
+
+    await requeue_expired()
+
+    assert await fake_redis.zcard(INFLIGHT_KEY) == 0
+    assert await fake_redis.llen(PROCESSING_KEY) == 0
+
+@pytest.mark.asyncio
+async def test_claim_drops_ids_whose_hash_expired(fake_redis):
+    job_id = await enqueue_job("AKG", "K371")
+    await fake_redis.delete(f"job:{job_id}")
+
+    assert await _claim(block_seconds=1) is None
+    assert not await fake_redis.exists(f"job:{job_id}")
+    assert await fake_redis.llen(PROCESSING_KEY) == 0
+
+@pytest.mark.asyncio
+async def test_provisional_is_stored_once_per_job(fake_redis):
+    job_id = await enqueue_job("AKG", "K371")
+
+    assert await set_job_provisional(job_id, {"model": "K361"}) == {"model": "K361"}
+    assert await set_job_provisional(job_id, {"model": "other"}) == {"model": "K361"}
+    assert (await get_job(job_id))["provisional"] == {"model": "K361"}
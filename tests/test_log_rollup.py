@@ -0,0 +1,50 @@
+import pytest
+from datetime import datetime
+from fakeredis import FakeAsyncRedis
+from src.services import log_rollup_service
+from src.services.log_rollup_service import build_rollup_pipeline, acquire_lease, _lookback, ROLLUP_COLLECTIONS
+
+def test_rollup_pipeline_groups_by_brand_model_event():
+    start, end = datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 2)
+    pipeline = build_rollup_pipeline("hour", start, end)
+
+    assert pipeline[0]["$match"]["timestamp"] == {"$gte": start, "$lt": end}
+    group_id = pipeline[1]["$group"]["_id"]
+    assert set(group_id) == {"bucket", "brand", "model", "event"}
+    assert group_id["event"] == "$meta.event"
+    # 重跑同一區間必須是冪等的
+    assert pipeline[-1]["$merge"]["into"] == ROLLUP_COLLECTIONS["hour"]
+    assert pipeline[-1]["$merge"]["whenMatched"] == "replace"
+
+def test_migrate_keeps_meta_for_both_document_shapes():
+    from bson import ObjectId
+    from src.cli.logs import to_timeseries_doc
+
+    ts = datetime(2024, 1, 1, 12)
+    legacy = {"_id": ObjectId(), "timestamp": ts, "event": "search_headphone", "user_id": "u1", "data": {"brand": "Sony"}}
+    # migrate 前就以新格式寫進一般 logs 的文件
+    new_shape = {"_id": ObjectId(), "timestamp": ts, "meta": {"event": "user_login", "user_id": "u2"}, "data": {}}
+
+    converted = to_timeseries_doc(legacy)
+    assert converted["meta"] == {"event": "search_headphone", "user_id": "u1"}
+    assert converted["data"] == {"brand": "Sony"}
+    assert to_timeseries_doc(new_shape)["meta"] == {"event": "user_login", "user_id": "u2"}
+
+    # 沒有 timestamp 時以 ObjectId 的建立時間代替
+    no_ts = to_timeseries_doc({"_id": ObjectId.from_datetime(ts), "event": "x"})
+    assert no_ts["timestamp"] == ts
+    assert no_ts["data"] == {}
+
+
+@pytest.mark.asyncio
+async def test_rollup_lease_runs_once_per_interval(monkeypatch):
+    monkeypatch.setattr(log_rollup_service.redis_db, "async_client", FakeAsyncRedis(decode_responses=True))
+    assert await acquire_lease(900)
+    # 同一週期內其他 Pod 拿不到
+    assert not await acquire_lease(900)
+
+
+def test_daily_rollup_only_looks_back_in_first_hour():
+    assert _lookback("day", datetime(2024, 1, 2, 0, 30)) == 2
+    assert _lookback("day", datetime(2024, 1, 2, 13, 0)) == 1
+    assert _lookback("hour", datetime(2024, 1, 2, 13, 0)) == 2
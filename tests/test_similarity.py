@@ -0,0 +1,103 @@
+import json
+import numpy as np
+import pytest
+from fakeredis import FakeAsyncRedis
+from src.services import similarity_service
+from src.services.similarity_service import SimilarityIndex, rebuild_from_cache
+
+def _rec(features, bass="低頻", connection="有線"):
+    return {
+        "form_factor": "耳罩式", "connection": connection, "release_year": "2020", "price_range": "$$",
+        "driver_config": "dynamic", "sound_features": features,
+        "analysis_bass": bass, "analysis_mids": "中頻", "analysis_highs": "高頻", "listening_guide": "",
+        "title": "t", "artist": "a", "comment": "", "cover_url": "", "spotify_url": "#", "track_id": "x",
+    }
+
+def test_similar_headphones_ranked_by_cosine():
+    index = SimilarityIndex(dim=1024, initial_capacity=1)
+    index.add("Sennheiser", "HD650", _rec(["溫暖", "人聲"]))
+    index.add("Sennheiser", "HD660S", _rec(["溫暖", "人聲", "解析"]))
+    index.add("Apple", "AirPods Pro", _rec(["降噪", "低頻"], connection="藍牙"))
+
+    hits = index.query("Sennheiser", "HD650", k=2)
+    assert [h[1] for h in hits][0] == "HD660S"
+    assert all(h[1] != "HD650" for h in hits)  # 不回傳自己
+    assert len(index) == 3  # 容量會自動擴充
+
+def test_unknown_model_matches_by_name():
+    index = SimilarityIndex(dim=1024)
+    index.add("Sennheiser", "HD600", _rec(["中性"]))
+    index.add("Sony", "WH-1000XM5", _rec(["降噪"]))
+
+    hits = index.query("Sennheiser", "HD6XX", k=1)
+    assert hits[0][:2] == ("Sennheiser", "HD600")
+
+def test_batched_query_shape():
+    index = SimilarityIndex(dim=512)
+    index.add("A", "One", _rec(["x"]))
+    queries = np.stack([index.vector_for("A", "One"), index.vector_for("B", "Two")])
+    assert len(index.query_many(queries, k=3)) == 2
+
+def test_max_entries_caps_index():
+    index = SimilarityIndex(dim=256, max_entries=2, initial_capacity=1)
+    assert index.add("A", "One", _rec(["x"]))
+    assert index.add("A", "Two", _rec(["x"]))
+    assert not index.add("A", "Three", _rec(["x"]))
+    assert index.add("A", "One", _rec(["y"]))  # 既有 key 仍可更新
+    assert len(index) == 2
+
+@pytest.mark.asyncio
+async def test_rebuild_swaps_in_fresh_scan(monkeypatch):
+    r = FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(similarity_service.redis_db, "async_client", r)
+    index = SimilarityIndex(dim=256)
+    index.add("Sony", "MDR-7506", _rec(["監聽"]))          # 快取已過期
+    index.add("Sennheiser", "HD650", _rec(["溫暖"]))
+    kept_vector = index.vector_for("Sennheiser", "HD650").copy()
+
+    await r.set("rec:sennheiser:hd650", json.dumps(_rec(["溫暖"])))
+    await r.set("rec:akg:k371", json.dumps(_rec(["中性"])))
+    await r.hset(similarity_service.redis_db.NAMES_KEY, "akg:k371", json.dumps(["AKG", "K371"]))
+
+    assert await rebuild_from_cache(index) == 2
+    assert "sony:mdr-7506" not in index
+    assert "akg:k371" in index
+    # 有記錄顯示名稱時保留原本的大小寫
+    assert index.query("Sennheiser", "HD650", k=5)[0][:2] == ("AKG", "K371")
+    np.testing.assert_array_equal(index.vector_for("sennheiser", "hd650"), kept_vector)
+    await r.aclose()
+
+@pytest.mark.asyncio
+async def test_ai_failure_falls_back_to_similar_headphone(monkeypatch):
+    from src.services import recommendation_service
+
+    index = SimilarityIndex(dim=1024, min_score=0.25)
+    index.add("Sony", "WH-1000XM5", {**_rec(["降噪"]), "title": "Shape of You"})
+    monkeypatch.setattr(recommendation_service, "similarity_index", index)
+
+    async def ai_down(brand, model):
+        return None
+
+    async def no_track(query):
+        return None
+    monkeypatch.setattr(recommendation_service, "analyze_headphone", ai_down)
+    monkeypatch.setattr(recommendation_service, "search_track", no_track)
+
+    result, should_cache = await recommendation_service.generate_recommendation("Sony", "WH-1000XM4")
+    assert result["title"] == "Shape of You"
+    assert "WH-1000XM5" in result["comment"]
+    assert should_cache is False
+
+    # 沒有夠相近的耳機時才用預設內容
+    result, should_cache = await recommendation_service.generate_recommendation("Beyerdynamic", "DT770")
+    assert result["comment"] == "AI Busy"
+    assert should_cache is False
+
+def test_low_scores_are_dropped():
+    loose, strict = SimilarityIndex(dim=1024), SimilarityIndex(dim=1024, min_score=0.25)
+    for index in (loose, strict):
+        index.add("Sennheiser", "HD650", _rec(["溫暖", "人聲"]))
+        index.add("Sony", "WH-1000XM5", _rec(["降噪"], connection="藍牙"))
+    # 只有共用的規格字詞，分數很低，不該當成相似耳機
+    assert [h[1] for h in loose.query("Sennheiser", "HD650", k=5)] == ["WH-1000XM5"]
+    assert strict.query("Sennheiser", "HD650", k=5) == []